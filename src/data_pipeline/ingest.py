@@ -1,8 +1,10 @@
-import pandas as pd
+import argparse
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
 from pathlib import Path
-from datetime import datetime, timedelta
-import random
+from datetime import datetime
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 RAW_DIR = PROJECT_ROOT / "data" / "raw"
@@ -12,69 +14,131 @@ RAW_DIR.mkdir(parents=True, exist_ok=True)
 (PROCESSED_DIR / "cdr").mkdir(parents=True, exist_ok=True)
 (PROCESSED_DIR / "gps").mkdir(parents=True, exist_ok=True)
 
+# One PCG64 generator shared by both simulators; every draw below requests a
+# full array at once instead of calling into the RNG per record.
+RNG = np.random.default_rng(42)
 
-def simulate_cdr_data(num_users=10000, num_records=3000000):
+BASE_TIME = np.datetime64(datetime(2024, 5, 1, 0, 0, 0), "s")
+WINDOW_SECONDS = 7 * 24 * 3600
+
+# Fixed tower id table; records pick towers by integer index into it
+TOWER_IDS = np.array([f"T{i}" for i in range(1, 51)])
+
+# Lucknow bounding box used for simulated GPS fixes
+LAT_MIN, LAT_MAX = 26.80, 26.92
+LON_MIN, LON_MAX = 80.90, 81.02
+
+
+def random_timestamps(size):
+    """
+    Returns `size` uniformly drawn datetime64[s] values within the one-week
+    simulation window. The array is built from integer offsets, so the CSV
+    writer formats the whole column natively instead of strftime per row.
+    """
+    offsets = RNG.integers(0, WINDOW_SECONDS, size=size, endpoint=True)
+    return BASE_TIME + offsets.astype("timedelta64[s]")
+
+
+def write_raw_csv(table, raw_path):
+    """
+    Writes table to raw_path with Arrow's CSV writer, which encodes whole
+    columns in C++ rather than going through pandas' row formatter.
+    Rows are encoded 64k at a time into a 4 MB buffered binary stream, so
+    the file sees few large writes.
+    """
+    with pa.output_stream(raw_path, buffer_size=1 << 22) as sink:
+        pv.write_csv(table, sink, write_options=pv.WriteOptions(batch_size=1 << 16))
+
+
+def simulate_cdr_data(num_users=10000, num_records=3000000, write_csv=False):
+    """
+    Simulates CDRs and writes them straight to a Parquet file under
+    data/processed/cdr/. The raw CSV under data/raw/ (the input of
+    streamer.py) is only written when write_csv is True.
+    """
     print(f"Simulating {num_records:,} CDRs for {num_users:,} users...")
 
-    user_ids = np.random.choice(range(1, num_users + 1), size=num_records, replace=True)
+    user_ids = RNG.integers(1, num_users + 1, size=num_records)
 
-    base_time = datetime(2024, 5, 1, 0, 0, 0)
-    timestamps = [base_time + timedelta(seconds=random.randint(0, 7 * 24 * 3600)) for _ in range(num_records)]
+    timestamps = random_timestamps(num_records)
 
-    tower_ids = [f"T{random.randint(1, 50)}" for _ in range(num_records)]
+    # Dictionary-encoded: the int8 codes index TOWER_IDS, so Parquet stores the
+    # 50 tower names once and pandas reads the column back as a category.
+    tower_codes = RNG.integers(0, len(TOWER_IDS), size=num_records, dtype=np.int8)
+    tower_ids = pa.DictionaryArray.from_arrays(tower_codes, TOWER_IDS)
 
-    df = pd.DataFrame({
+    table = pa.table({
         "user_id": user_ids,
-        "timestamp": pd.to_datetime(timestamps),
+        "timestamp": timestamps,
         "tower_id": tower_ids
     })
 
-    raw_path = RAW_DIR / f"cdr_lucknow_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    df.to_csv(raw_path, index=False)
-    print(f"Raw CDR saved to {raw_path.name} (shape={df.shape})")
+    # Fixed name, so a re-run replaces the previous simulation instead of
+    # adding a second dataset next to it
+    stem = "cdr_lucknow"
+    if write_csv:
+        raw_path = RAW_DIR / f"{stem}.csv"
+        write_raw_csv(table, raw_path)
+        print(f"Raw CDR saved to {raw_path.name} (shape={table.shape})")
 
-    # Chunk & save as parquet
+    # Single parquet file, one row group per chunk
     chunk_size = 200000
-    for i, start in enumerate(range(0, len(df), chunk_size)):
-        chunk = df.iloc[start:start + chunk_size]
-        out_path = PROCESSED_DIR / "cdr" / f"cdr_chunk_{i:03}.parquet"
-        chunk.to_parquet(out_path, index=False)
-    print(f"{i+1} CDR chunks written to data/processed/cdr/")
-
-
-def simulate_gps_data(num_devices=3000, num_records=500000):
+    out_path = PROCESSED_DIR / "cdr" / f"{stem}.parquet"
+    with pq.ParquetWriter(out_path, table.schema, compression="zstd") as writer:
+        for i, start in enumerate(range(0, table.num_rows, chunk_size)):
+            writer.write_table(table.slice(start, chunk_size))
+    print(f"{out_path.name} written to data/processed/cdr/ ({i+1} row groups)")
+
+
+def simulate_gps_data(num_devices=3000, num_records=500000, write_csv=False):
+    """
+    Simulates GPS fixes and writes them straight to a Parquet file under
+    data/processed/gps/. The raw CSV under data/raw/ is only written when
+    write_csv is True.
+    """
     print(f"Simulating {num_records:,} GPS records for {num_devices:,} devices...")
 
-    device_ids = np.random.choice(range(1, num_devices + 1), size=num_records, replace=True)
+    device_ids = RNG.integers(1, num_devices + 1, size=num_records)
 
-    base_time = datetime(2024, 5, 1, 0, 0, 0)
-    timestamps = [base_time + timedelta(seconds=random.randint(0, 7 * 24 * 3600)) for _ in range(num_records)]
+    timestamps = random_timestamps(num_records)
 
-    latitudes = np.random.uniform(26.80, 26.92, num_records)
-    longitudes = np.random.uniform(80.90, 81.02, num_records)
-    speeds = np.random.normal(loc=30, scale=10, size=num_records).clip(0, 100)  # kmph
+    # Single (num_records, 2) draw; low/high broadcast per column, so the
+    # generator scales both coordinates in one pass.
+    coords = RNG.uniform(low=(LAT_MIN, LON_MIN), high=(LAT_MAX, LON_MAX), size=(num_records, 2))
+    latitudes = coords[:, 0]
+    longitudes = coords[:, 1]
+    speeds = RNG.normal(loc=30, scale=10, size=num_records).clip(0, 100)  # kmph
 
-    df = pd.DataFrame({
+    table = pa.table({
         "device_id": device_ids,
-        "timestamp": pd.to_datetime(timestamps),
+        "timestamp": timestamps,
         "latitude": latitudes,
         "longitude": longitudes,
         "speed_kmph": speeds
     })
 
-    raw_path = RAW_DIR / f"gps_lucknow_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    df.to_csv(raw_path, index=False)
-    print(f"Raw GPS saved to {raw_path.name} (shape={df.shape})")
+    # Fixed name, so a re-run replaces the previous simulation instead of
+    # adding a second dataset next to it
+    stem = "gps_lucknow"
+    if write_csv:
+        raw_path = RAW_DIR / f"{stem}.csv"
+        write_raw_csv(table, raw_path)
+        print(f"Raw GPS saved to {raw_path.name} (shape={table.shape})")
 
-    # Chunk & save as parquet
+    # Single parquet file, one row group per chunk
     chunk_size = 100000
-    for i, start in enumerate(range(0, len(df), chunk_size)):
-        chunk = df.iloc[start:start + chunk_size]
-        out_path = PROCESSED_DIR / "gps" / f"gps_chunk_{i:03}.parquet"
-        chunk.to_parquet(out_path, index=False)
-    print(f"✓ {i+1} GPS chunks written to data/processed/gps/")
+    out_path = PROCESSED_DIR / "gps" / f"{stem}.parquet"
+    with pq.ParquetWriter(out_path, table.schema, compression="zstd") as writer:
+        for i, start in enumerate(range(0, table.num_rows, chunk_size)):
+            writer.write_table(table.slice(start, chunk_size))
+    print(f"✓ {out_path.name} written to data/processed/gps/ ({i+1} row groups)")
 
 
 if __name__ == "__main__":
-    simulate_cdr_data()
-    simulate_gps_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Simulate Lucknow CDR and GPS data.")
+    parser.add_argument("--write-csv", action="store_true",
+                        help="also write the raw CSVs under data/raw/ (the input of streamer.py)")
+    args = parser.parse_args()
+
+    simulate_cdr_data(write_csv=args.write_csv)
+    simulate_gps_data(write_csv=args.write_csv)
\ No newline at end of file
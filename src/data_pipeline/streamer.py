@@ -1,24 +1,69 @@
 import os
 from pathlib import Path
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
 from datetime import datetime
 
 PROJECT_ROOT   = Path(__file__).resolve().parent.parent.parent
 RAW_DIR        = PROJECT_ROOT / "data" / "raw"
 PROCESSED_DIR  = PROJECT_ROOT / "data" / "processed"
 
-# Chuck size
-CHUNK_SIZE = 200_000
+# Bytes of CSV parsed per batch; each batch becomes one Parquet row group
+BLOCK_SIZE = 16 << 20
+
+# Explicit column types so Arrow parses straight into the final dtypes.
+# Timestamps are naive in the CSV and are tagged as UTC after parsing.
+COLUMN_TYPES = {
+    "cdr": {
+        "user_id": pa.int64(),
+        "timestamp": pa.timestamp("s"),
+        "tower_id": pa.string(),
+    },
+    "gps": {
+        "device_id": pa.int64(),
+        "timestamp": pa.timestamp("s"),
+        "latitude": pa.float64(),
+        "longitude": pa.float64(),
+        "speed_kmph": pa.float64(),
+    },
+}
+UTC_TIMESTAMP = pa.timestamp("s", tz="UTC")
+
+# Lucknow bounding box; GPS fixes outside it are dropped (same box as ingest.py)
+LAT_MIN, LAT_MAX = 26.80, 26.92
+LON_MIN, LON_MAX = 80.90, 81.02
 
 def ensure_processed_folders_exist():
     """Make sure data/processed/cdr/ and data/processed/gps/ exist."""
     (PROCESSED_DIR / "cdr").mkdir(parents=True, exist_ok=True)
     (PROCESSED_DIR / "gps").mkdir(parents=True, exist_ok=True)
 
+def clean_batch(batch: pa.RecordBatch, kind: str) -> pa.Table:
+    """
+    Light cleaning of one parsed CSV batch: tag timestamps as UTC and,
+    for GPS, drop fixes outside the Lucknow bounds.
+    """
+    table = pa.Table.from_batches([batch])
+    ts_idx = table.schema.get_field_index("timestamp")
+    table = table.set_column(ts_idx, "timestamp", table["timestamp"].cast(UTC_TIMESTAMP))
+
+    if kind == "gps":
+        in_bounds = pc.and_(
+            pc.and_(pc.greater_equal(table["latitude"], LAT_MIN), pc.less_equal(table["latitude"], LAT_MAX)),
+            pc.and_(pc.greater_equal(table["longitude"], LON_MIN), pc.less_equal(table["longitude"], LON_MAX)),
+        )
+        table = table.filter(in_bounds)
+
+    return table
+
+
 def stream_csv_to_parquet(raw_file: Path, kind: str):
     """
-    Read raw_file (CSV) in CHUNK_SIZE pieces, and write each chunk as
-    a Parquet file under data/processed/{kind}/ or data/streamed/{kind}/.
+    Stream raw_file (CSV) through Arrow's CSV reader in BLOCK_SIZE batches
+    and write them as row groups of a single Parquet file under
+    data/processed/{kind}/.
 
     kind must be either "cdr" or "gps".
     """
@@ -28,31 +73,23 @@ def stream_csv_to_parquet(raw_file: Path, kind: str):
 
     # Cleaned Parquet directly into data/processed/{type}/
     dest_folder = PROCESSED_DIR / kind
+    out_path = dest_folder / f"{raw_file.stem}.parquet"
 
-    for idx, chunk in enumerate(pd.read_csv(raw_file, chunksize=CHUNK_SIZE, iterator=True)):
-        # Optionally: if there is transform logic that expects a Parquet path,
-        # it could first write this chunk to STREAMED_DIR, then call transform_chunk(...)
-        # For simplicity,it'll be directly clean & write to data/processed/
-
-        # Example “light cleaning” in‐line:
-        if kind == "cdr":
-            # Parse timestamp (string → datetime)
-            chunk["timestamp"] = pd.to_datetime(chunk["timestamp"], format="%Y-%m-%d %H:%M:%S", utc=True)
-        else:  # kind == "gps"
-            chunk["timestamp"] = pd.to_datetime(chunk["timestamp"], format="%Y-%m-%d %H:%M:%S", utc=True)
-            # Optionally clamp lat/lon to Lucknow bounds:
-            chunk = chunk[
-                chunk["latitude"].between(26.80, 26.92) &
-                chunk["longitude"].between(80.90, 81.02)
-            ]
+    reader = pv.open_csv(
+        raw_file,
+        read_options=pv.ReadOptions(block_size=BLOCK_SIZE),
+        convert_options=pv.ConvertOptions(column_types=COLUMN_TYPES[kind]),
+    )
+    schema = reader.schema
+    schema = schema.set(schema.get_field_index("timestamp"), pa.field("timestamp", UTC_TIMESTAMP))
 
-        # Write each chunk as Parquet
-        chunk_name = raw_file.stem 
-        out_path = dest_folder / f"{chunk_name}_chunk_{idx:03d}.parquet"
-        chunk.to_parquet(out_path, index=False)
-        print(f"  • Wrote chunk #{idx:03d} → {out_path.name}")
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for idx, batch in enumerate(reader):
+            table = clean_batch(batch, kind)
+            writer.write_table(table)
+            print(f"  • Wrote row group #{idx:03d} ({table.num_rows:,} rows)")
 
-    print(f"Done streaming {raw_file.name} → {len(list(dest_folder.glob(f'{chunk_name}_chunk_*.parquet')))} files")
+    print(f"Done streaming {raw_file.name} → {out_path.name}")
 
 
 if __name__ == "__main__":
@@ -62,18 +99,18 @@ if __name__ == "__main__":
 
     This script will:
     1) Look in data/raw/ for any CSVs named cdr_*.csv or gps_*.csv
-    2) For each, read in CHUNK_SIZE rows at a time and write cleaned Parquet
+    2) For each, parse BLOCK_SIZE bytes at a time and write cleaned row groups
     into data/processed/cdr/ or data/processed/gps/
     """
     ensure_processed_folders_exist()
 
     # 1) Find all "cdr_*.csv"
-    cdr_files = sorted(RAW_DIR.glob("cdr_lucknow_*.csv"))
+    cdr_files = sorted(RAW_DIR.glob("cdr_lucknow*.csv"))
     # 2) Find all "gps_*.csv"
-    gps_files = sorted(RAW_DIR.glob("gps_lucknow_*.csv"))
+    gps_files = sorted(RAW_DIR.glob("gps_lucknow*.csv"))
 
     if not cdr_files and not gps_files:
-        print("No raw CDR/GPS CSVs found under data/raw/. Run ingest.py first.")
+        print("No raw CDR/GPS CSVs found under data/raw/. Run `python src/data_pipeline/ingest.py --write-csv` first.")
         exit(0)
 
     # Stream each CDR CSV
@@ -1,26 +1,70 @@
 import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 PROJECT_ROOT    = Path(__file__).resolve().parent.parent.parent
 PROCESSED_DIR   = PROJECT_ROOT / "data" / "processed"
 
-def transform_cdr_chunk(parquet_path: Path):
-    df = pd.read_parquet(parquet_path)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True).dt.tz_convert("Asia/Kolkata")
+# Lucknow bounding box; GPS fixes outside it are dropped (same box as ingest.py)
+LAT_MIN, LAT_MAX = 26.80, 26.92
+LON_MIN, LON_MAX = 80.90, 81.02
+
+
+def to_kolkata_time(timestamps: pd.Series) -> pd.Series:
+    """
+    Converts a timestamp column to Asia/Kolkata. Columns that are already
+    tz-aware (the streamer writes UTC) are converted directly; naive
+    datetimes are taken as UTC; only strings go through parsing.
+    """
+    if isinstance(timestamps.dtype, pd.DatetimeTZDtype):
+        return timestamps.dt.tz_convert("Asia/Kolkata")
+    if pd.api.types.is_datetime64_dtype(timestamps):
+        return timestamps.dt.tz_localize("UTC").dt.tz_convert("Asia/Kolkata")
+    return pd.to_datetime(timestamps, utc=True, format="ISO8601").dt.tz_convert("Asia/Kolkata")
+
+
+def row_groups(parquet_paths):
+    """
+    Lists (path, row group index) pairs for every row group of every file,
+    so that even a single large file is spread across the worker processes.
+    """
+    return [(path, i) for path in parquet_paths for i in range(pq.ParquetFile(path).num_row_groups)]
+
+
+def remove_cleaned_outputs(parquet_paths, cleaned_folder):
+    """
+    Deletes what earlier runs wrote for these inputs, so a file with fewer
+    row groups than before does not leave stale cleaned pieces behind.
+    """
+    for path in parquet_paths:
+        for old in cleaned_folder.glob(f"{path.stem}_*cleaned.parquet"):
+            old.unlink()
+
+
+def transform_cdr_chunk(parquet_path: Path, row_group: int):
+    df = pq.ParquetFile(parquet_path).read_row_group(row_group).to_pandas()
+    df["timestamp"] = to_kolkata_time(df["timestamp"])
     df = df[df["tower_id"].notnull()]
     cleaned_folder = PROCESSED_DIR / "cdr_cleaned"
     cleaned_folder.mkdir(parents=True, exist_ok=True)
-    out_path = cleaned_folder / f"{parquet_path.stem}_cleaned.parquet"
+    out_path = cleaned_folder / f"{parquet_path.stem}_{row_group:03d}_cleaned.parquet"
     df.to_parquet(out_path, index=False)
     print(f"CDR chunk cleaned → {out_path.name}")
 
-def transform_gps_chunk(parquet_path: Path):
-    df = pd.read_parquet(parquet_path)
-    df = df[df["latitude"].between(26.80, 26.92) & df["longitude"].between(80.90, 81.02)]
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True).dt.tz_convert("Asia/Kolkata")
+def transform_gps_chunk(parquet_path: Path, row_group: int):
+    # Lucknow bounds are applied to the Arrow table, so out-of-bounds rows
+    # are dropped before they are materialized as a DataFrame
+    table = pq.ParquetFile(parquet_path).read_row_group(row_group)
+    df = table.filter(
+        (pc.field("latitude") >= LAT_MIN) & (pc.field("latitude") <= LAT_MAX)
+        & (pc.field("longitude") >= LON_MIN) & (pc.field("longitude") <= LON_MAX)
+    ).to_pandas()
+    df["timestamp"] = to_kolkata_time(df["timestamp"])
     cleaned_folder = PROCESSED_DIR / "gps_cleaned"
     cleaned_folder.mkdir(parents=True, exist_ok=True)
-    out_path = cleaned_folder / f"{parquet_path.stem}_cleaned.parquet"
+    out_path = cleaned_folder / f"{parquet_path.stem}_{row_group:03d}_cleaned.parquet"
     df.to_parquet(out_path, index=False)
     print(f"GPS chunk cleaned → {out_path.name}")
 
@@ -32,7 +76,13 @@ if __name__ == "__main__":
     if not cdr_chunks and not gps_chunks:
         print("No CDR or GPS chunks found in processed folders.")
     else:
-        for path in cdr_chunks:
-            transform_cdr_chunk(path)
-        for path in gps_chunks:
-            transform_gps_chunk(path)
+        remove_cleaned_outputs(cdr_chunks, PROCESSED_DIR / "cdr_cleaned")
+        remove_cleaned_outputs(gps_chunks, PROCESSED_DIR / "gps_cleaned")
+
+        # Row groups are independent, so every CDR and GPS row group is
+        # submitted up front and cleaned in parallel across cores
+        with ProcessPoolExecutor() as executor:
+            futures = [executor.submit(transform_cdr_chunk, path, i) for path, i in row_groups(cdr_chunks)]
+            futures += [executor.submit(transform_gps_chunk, path, i) for path, i in row_groups(gps_chunks)]
+            for future in futures:
+                future.result()
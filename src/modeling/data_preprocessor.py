@@ -5,6 +5,13 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 
+# hour_of_day and day_of_week only take 24 and 7 values, so their sine/cosine
+# encodings are precomputed once and gathered by index per row.
+HOUR_SIN = np.sin(2 * np.pi * np.arange(24) / 24)
+HOUR_COS = np.cos(2 * np.pi * np.arange(24) / 24)
+DOW_SIN = np.sin(2 * np.pi * np.arange(7) / 7)
+DOW_COS = np.cos(2 * np.pi * np.arange(7) / 7)
+
 def create_time_features(df, time_col='hour'):
     """
     Extracts cyclical and basic time-based features from a datetime column.
@@ -21,10 +28,12 @@ def create_time_features(df, time_col='hour'):
     # Cyclical features for hour of day and day of week using sine/cosine transformations
     # This helps models capture the cyclical nature without implying a linear relationship
     # between, for example, hour 23 and hour 0.
-    df['hour_sin'] = np.sin(2 * np.pi * df['hour_of_day'] / 24)
-    df['hour_cos'] = np.cos(2 * np.pi * df['hour_of_day'] / 24)
-    df['dayofweek_sin'] = np.sin(2 * np.pi * df['day_of_week'] / 7)
-    df['dayofweek_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7)
+    hour_idx = df['hour_of_day'].to_numpy()
+    dow_idx = df['day_of_week'].to_numpy()
+    df['hour_sin'] = HOUR_SIN[hour_idx]
+    df['hour_cos'] = HOUR_COS[hour_idx]
+    df['dayofweek_sin'] = DOW_SIN[dow_idx]
+    df['dayofweek_cos'] = DOW_COS[dow_idx]
 
     return df
 
@@ -46,30 +55,44 @@ def create_lag_and_rolling_features(df, group_cols, time_col, target_col, lags=[
     # Sort data by group and time to ensure correct lag/rolling calculations
     df = df.sort_values(by=group_cols + [time_col])
 
+    # Hash the (possibly multi-column) group key once into a single integer id;
+    # every groupby below reuses it instead of rebuilding composite keys.
+    group_ids = df.groupby(group_cols, sort=False, observed=True).ngroup()
+    grouped = df.groupby(group_ids, sort=False)
+
     # Lag features: Value of the target at previous time steps
     print(f"  - Creating lag features for '{target_col}'...")
     for lag in lags:
-        df[f'{target_col}_lag_{lag}'] = df.groupby(group_cols)[target_col].shift(lag)
+        df[f'{target_col}_lag_{lag}'] = grouped[target_col].shift(lag)
 
     # Rolling window features: Statistics over a preceding window of data
+    # groupby().rolling() runs the window kernels in Cython over all groups,
+    # instead of dispatching a Python lambda per group through transform().
+    # Its result is indexed by (group id, original index), so the group level
+    # is dropped to align back onto df.
     print(f"  - Creating rolling features for '{target_col}'...")
     for window in window_sizes:
         # min_periods=1 allows calculation even with fewer data points than window size at the start of a series
-        df[f'{target_col}_rolling_mean_{window}h'] = df.groupby(group_cols)[target_col].transform(lambda x: x.rolling(window=window, min_periods=1).mean())
-        df[f'{target_col}_rolling_std_{window}h'] = df.groupby(group_cols)[target_col].transform(lambda x: x.rolling(window=window, min_periods=1).std())
+        rolling = grouped[target_col].rolling(window=window, min_periods=1)
+        df[f'{target_col}_rolling_mean_{window}h'] = rolling.mean().droplevel(0)
+        df[f'{target_col}_rolling_std_{window}h'] = rolling.std().droplevel(0)
 
     # Fill NaNs created by lagging/rolling.
     # Forward fill (ffill) propagates last valid observation forward.
     # Backward fill (bfill) propagates next valid observation backward (for initial NaNs).
     # This is a common strategy, but you might explore more sophisticated imputation
     # (e.g., mean of the series, or using a predictive model for imputation) if needed.
+    # All feature columns are filled in one grouped pass per direction, with the group ids
+    # computed once rather than once per column. Both fills stay within each group, so a
+    # group whose feature is entirely NaN never picks up its neighbour's values.
     print("  - Filling NaNs introduced by lag/rolling features...")
-    for col in df.columns:
-        if col.startswith(f'{target_col}_lag_') or col.startswith(f'{target_col}_rolling_'):
-            df[col] = df.groupby(group_cols)[col].ffill().bfill()
-            # After ffill/bfill within groups, if any NaNs remain (e.g., an entire group is NaN for that feature),
-            # fill with a sensible default like 0 or the overall mean/median.
-            df[col] = df[col].fillna(0) # Using 0 as a placeholder for initial missing lags/rolling values
+    feat_cols = [col for col in df.columns
+                 if col.startswith(f'{target_col}_lag_') or col.startswith(f'{target_col}_rolling_')]
+    # After ffill/bfill, if any NaNs remain (e.g., an entire group is NaN for that feature),
+    # fill with a sensible default like 0 or the overall mean/median.
+    # Using 0 as a placeholder for initial missing lags/rolling values
+    filled = df.groupby(group_ids, sort=False)[feat_cols].ffill()
+    df[feat_cols] = filled.groupby(group_ids, sort=False).bfill().fillna(0)
 
     return df
 
@@ -1,97 +1,346 @@
+import argparse
+import os
+import tempfile
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from join_data import PARQUET_OPTIONS
+
 PROJECT_ROOT   = Path(__file__).resolve().parent.parent.parent
 PROCESSED_DIR  = PROJECT_ROOT / "data" / "processed"
 
 
-def build_od_flows():
+# Number of distinct 0.01-degree grid rows/columns (latitude -90..90,
+# longitude -180..180), used to pack (hour, grid_lat, grid_lon) into one key
+LAT_SPAN = 18_001
+LON_SPAN = 36_001
+
+# Asia/Kolkata has a fixed +05:30 offset (no DST), so local hours can be
+# derived from UTC values without a tz_convert pass over the column
+IST_OFFSET = np.timedelta64(330, "m")
+
+# Timestamp type the cleaned chunks are read as, whatever unit/zone each chunk
+# was written with (same as the merged files written by join_data.py)
+SCAN_TIMESTAMP = pa.timestamp("us", tz="UTC")
+
+# CDR columns the OD-flow counting reads
+OD_COLUMNS = ["user_id", "tower_id", "timestamp"]
+
+# Rows each user bucket buffers before writing them out as one row group
+BUCKET_ROW_GROUP_SIZE = 1 << 18
+
+
+def hour_buckets(timestamps):
+    """
+    Floors UTC timestamps to their Asia/Kolkata (wall-clock) hour, returned
+    as int64 hours since the epoch. Integer keys are cheaper to hash in
+    groupby than datetime64 values, and no floored datetime column is allocated.
+    NaT timestamps have no hour: their bucket is 0 and they are False in the
+    returned validity mask, so callers drop them (as a groupby on the floored
+    column drops NaT keys) instead of packing int64-min into their keys.
+    Returns (buckets, valid).
+    """
+    values = timestamps.values
+    valid = ~np.isnat(values)
+    buckets = (values + IST_OFFSET).astype("datetime64[h]").view("i8")
+    buckets[~valid] = 0
+    return buckets, valid
+
+
+def buckets_to_hours(buckets):
+    """Converts int64 hour buckets back to Asia/Kolkata timestamps."""
+    return pd.to_datetime(buckets, unit="h").dt.tz_localize("Asia/Kolkata")
+
+
+def write_by_day(df, buckets, out_path):
+    """
+    Writes hour-sorted feature rows to a single Parquet file with one row group
+    per Asia/Kolkata day (buckets are the rows' local hour buckets). The hour
+    min/max statistics then let hour-range reads skip whole days, like a
+    partitioned dataset, while readers still see one plain file.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    days = np.asarray(buckets) // 24
+    new_day = np.ones(len(days), dtype=bool)
+    new_day[1:] = days[1:] != days[:-1]
+    bounds = np.append(np.flatnonzero(new_day), len(days))
+    with pq.ParquetWriter(out_path, table.schema, **PARQUET_OPTIONS) as writer:
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            writer.write_table(table.slice(start, stop - start))
+
+
+def cleaned_dataset(folder):
+    """
+    Opens the cleaned Parquet chunks under folder as one dataset, so they are
+    scanned in place instead of being merged into a single file first.
+    The schema is the first chunk's, with timestamp as SCAN_TIMESTAMP and
+    dictionary columns on int32 indices; the scanner casts every chunk to it
+    (e.g. a plain string vs dictionary-encoded tower_id). The pandas metadata
+    is dropped so the chunks' original time zone is not re-applied on read.
+    Returns None when folder holds no chunks.
+    """
+    parquet_files = sorted(str(path) for path in folder.glob("*.parquet"))
+    if not parquet_files:
+        return None
+    schema = pq.read_schema(parquet_files[0]).remove_metadata()
+    for i, field in enumerate(schema):
+        if field.name == "timestamp":
+            schema = schema.set(i, pa.field("timestamp", SCAN_TIMESTAMP))
+        elif pa.types.is_dictionary(field.type):
+            schema = schema.set(i, pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type)))
+    return ds.dataset(parquet_files, schema=schema, format="parquet")
+
+
+def bucket_by_user(dataset, num_buckets, bucket_dir):
+    """
+    Rewrites the OD columns of a CDR dataset once into num_buckets Parquet
+    files under bucket_dir, putting each event in bucket user_id % num_buckets.
+    The dataset is streamed one scanner batch at a time; each bucket's slices
+    are buffered until they reach BUCKET_ROW_GROUP_SIZE rows and then written
+    as one row group, so buffering holds at most about num_buckets *
+    BUCKET_ROW_GROUP_SIZE rows and the files do not fill up with tiny row
+    groups. Every user lands in exactly one bucket, so each bucket file can be
+    counted on its own and holds only its share (about 1/num_buckets) of the
+    rows. Returns the bucket file paths.
+    """
+    scanner = dataset.scanner(columns=OD_COLUMNS, batch_size=1 << 20)
+    paths = [bucket_dir / f"bucket_{b:03d}.parquet" for b in range(num_buckets)]
+    writers = [pq.ParquetWriter(path, scanner.projected_schema, **PARQUET_OPTIONS) for path in paths]
+    pending = [[] for _ in paths]
+
+    def flush(b):
+        table = pa.Table.from_batches(pending[b], schema=scanner.projected_schema)
+        writers[b].write_table(table, row_group_size=table.num_rows)
+        pending[b] = []
+
+    try:
+        for batch in scanner.to_batches():
+            # Group the batch's rows by bucket with one stable sort, then hand
+            # each bucket its contiguous slice
+            buckets = batch.column("user_id").to_numpy(zero_copy_only=False) % num_buckets
+            order = np.argsort(buckets, kind="stable")
+            bounds = np.searchsorted(buckets[order], np.arange(num_buckets + 1))
+            batch = batch.take(pa.array(order))
+            for b, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+                if stop > start:
+                    pending[b].append(batch.slice(start, stop - start))
+                    if sum(len(piece) for piece in pending[b]) >= BUCKET_ROW_GROUP_SIZE:
+                        flush(b)
+        for b, pieces in enumerate(pending):
+            if pieces:
+                flush(b)
+    finally:
+        for writer in writers:
+            writer.close()
+    return paths
+
+
+def count_od_hops(df):
+    """
+    Counts tower hops per (hour bucket, origin_tower, dest_tower) for a frame
+    of (user_id, tower_id, timestamp) events. Every event of each user in df
+    must be present, since hops are taken between consecutive events.
+    Returns the hop counts and the number of events per user.
+    """
+    # Tower ids as a category (a no-op when the Parquet column is already
+    # dictionary-encoded): the hop extraction below works on its integer codes,
+    # and origin/dest stay categorical through to the dictionary-encoded output.
+    # user_id is already an integer column.
+    df["tower_id"] = df["tower_id"].astype("category")
+
+    # Sort by user_id & timestamp
+    df.sort_values(["user_id", "timestamp"], inplace=True)
+
+    # Determine origin tower for each event; the event's own tower_id is the
+    # destination. The frame is sorted by user, so the origin is simply the
+    # previous row's tower, masked out (code -1) wherever a new user starts.
+    tower_codes = df["tower_id"].cat.codes.to_numpy().astype(np.int64)
+    user_ids = df["user_id"].to_numpy()
+    new_user = np.ones(len(user_ids), dtype=bool)
+    new_user[1:] = user_ids[1:] != user_ids[:-1]
+    origin_codes = np.empty_like(tower_codes)
+    origin_codes[1:] = tower_codes[:-1]
+    origin_codes[new_user] = -1
+
+    # Events per user from the same boundaries: users are contiguous runs in
+    # the sorted frame, so the run lengths are the counts (no groupby pass)
+    starts = np.flatnonzero(new_user)
+    events_per_user = pd.Series(np.diff(np.append(starts, len(user_ids))),
+                                index=user_ids[starts])
+
+    # Floor timestamp to the hour (as an integer bucket)
+    hours, has_hour = hour_buckets(df["timestamp"])
+
+    # Count flows per (hour, origin, dest). Each hop (event with an origin, a
+    # destination tower and a timestamp) is packed into a single int64 key, so
+    # counting is one np.unique pass with no groupby machinery; the keys are
+    # unpacked only for the distinct flows. A null tower has code -1, which
+    # would corrupt the packed key, so such hops are left out as groupby drops
+    # missing keys.
+    hops = (origin_codes >= 0) & (tower_codes >= 0) & has_hour
+    n_towers = len(df["tower_id"].cat.categories)
+    keys = (hours[hops] * n_towers + origin_codes[hops]) * n_towers + tower_codes[hops]
+    keys, counts = np.unique(keys, return_counts=True)
+
+    tower_dtype = df["tower_id"].dtype
+    od = pd.DataFrame({
+        "hour": keys // (n_towers * n_towers),
+        "origin_tower": pd.Categorical.from_codes(keys // n_towers % n_towers, dtype=tower_dtype),
+        "dest_tower": pd.Categorical.from_codes(keys % n_towers, dtype=tower_dtype),
+        "count": counts,
+    })
+    return od, events_per_user
+
+
+def count_od_bucket(bucket_path):
+    """Loads one user bucket written by bucket_by_user and counts its tower hops."""
+    return count_od_hops(pq.read_table(bucket_path).to_pandas())
+
+
+def build_od_flows(num_partitions=1):
     """
-    From the merged CDR data (user_id, tower_id, timestamp),
+    From the cleaned CDR data (user_id, tower_id, timestamp),
     compute origin→destination(od) flows per hour.
 
-    - Loads data/processed/cdr_merged.parquet
+    - Scans the data/processed/cdr_cleaned/ chunks, one user bucket at a time
     - Sorts by user_id + timestamp
     - For each user, identifies consecutive tower hops (prev_tower -> current tower)
     - Aggregates counts of (hour, origin, destination) into od_flows.parquet
+
+    Users never span buckets, so each bucket can be processed on its own and
+    only the small per-bucket counts are kept. With num_partitions > 1 the
+    three OD columns are first rewritten once into num_partitions user buckets
+    (one extra write and read of those columns), and the buckets are counted
+    in parallel worker processes, each holding roughly 1/num_partitions of the
+    CDR data. Up to one worker per CPU runs at a time, so peak memory is about
+    min(num_partitions, CPUs)/num_partitions of the data; choose more
+    partitions than CPUs to bound it further.
     """
-    cdr_path = PROCESSED_DIR / "cdr_merged.parquet"
-    if not cdr_path.exists():
-        print(f"File not found: {cdr_path}")
+    cdr_folder = PROCESSED_DIR / "cdr_cleaned"
+    if not cdr_folder.exists():
+        print(f"Directory not found: {cdr_folder}")
         return
 
-    print("Loading merged CDR data...")
-    df = pd.read_parquet(cdr_path)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True).dt.tz_convert("Asia/Kolkata")
-
-    # Sort by user_id & timestamp
-    df.sort_values(["user_id", "timestamp"], inplace=True)
+    dataset = cleaned_dataset(cdr_folder)
+    if dataset is None:
+        print(f"No CDR chunks found under: {cdr_folder}")
+        return
 
-    # Determine origin/destination tower for each event
-    df["origin_tower"] = df.groupby("user_id")["tower_id"].shift()
-    df["dest_tower"] = df["tower_id"]
+    print("Loading cleaned CDR chunks...")
+    if num_partitions <= 1:
+        # Only the columns used below are read; Parquet skips the other column chunks
+        results = [count_od_hops(dataset.to_table(columns=OD_COLUMNS).to_pandas())]
+    else:
+        with tempfile.TemporaryDirectory(prefix="od_buckets_", dir=PROCESSED_DIR) as bucket_dir:
+            bucket_paths = bucket_by_user(dataset, num_partitions, Path(bucket_dir))
+            workers = min(num_partitions, os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(count_od_bucket, bucket_paths))
+    od_parts = [od_part for od_part, _ in results]
 
-    print("Total records before dropna:", df.shape[0])
-    print("Unique users:", df['user_id'].nunique())
+    user_counts = pd.concat([events_per_user for _, events_per_user in results])
+    print("Total records before dropna:", user_counts.sum())
+    print("Unique users:", user_counts.size)
     print("CDRs per user (sample):")
-    print(df.groupby("user_id").size().describe())
+    print(user_counts.describe())
 
-    df = df.dropna(subset=["origin_tower"])
-
-    # Floor timestamp to the hour
-    df["hour"] = df["timestamp"].dt.floor("h")
-
-    # Count flows per (hour, origin, dest)
-    od = (
-        df.groupby(["hour", "origin_tower", "dest_tower"])
-            .size()
-            .reset_index(name="count")
-    )
+    # Each part comes out of count_od_hops sorted by hour
+    od = pd.concat(od_parts, ignore_index=True)
+    if len(od_parts) > 1:
+        # The same (hour, origin, dest) can appear in several user buckets
+        od = od.groupby(["hour", "origin_tower", "dest_tower"],
+                        sort=True, observed=True, as_index=False)["count"].sum()
+        od[["origin_tower", "dest_tower"]] = od[["origin_tower", "dest_tower"]].astype("category")
+    buckets = od["hour"].to_numpy()
+    od["hour"] = buckets_to_hours(od["hour"])
+    # Hop counts per (hour, origin, dest) fit comfortably in 32 bits
+    od["count"] = od["count"].astype(np.uint32)
 
     out_path = PROCESSED_DIR / "od_flows.parquet"
-    od.to_parquet(out_path, index=False)
+    write_by_day(od, buckets, out_path)
     print(f"OD flows saved to {out_path.name} (rows: {od.shape[0]})")
 
 
 def build_gps_speed_features():
     """
-    From merged GPS data (device_id, latitude, longitude, timestamp, speed_kmph),
+    From cleaned GPS data (device_id, latitude, longitude, timestamp, speed_kmph),
     aggregate average speed per hour + coarse grid cell:
-    - Loads data/processed/gps_merged.parquet
+    - Scans the data/processed/gps_cleaned/ chunks
     - Floors timestamp to hour
     - Rounds lat/lon to 2 decimals to create grid cell
     - Aggregates mean speed per (hour, grid_id)
     """
-    gps_path = PROCESSED_DIR / "gps_merged.parquet"
-    if not gps_path.exists():
-        print(f"File not found: {gps_path}")
+    gps_folder = PROCESSED_DIR / "gps_cleaned"
+    if not gps_folder.exists():
+        print(f"Directory not found: {gps_folder}")
+        return
+
+    dataset = cleaned_dataset(gps_folder)
+    if dataset is None:
+        print(f"No GPS chunks found under: {gps_folder}")
         return
 
-    print("Loading merged GPS data...")
-    df = pd.read_parquet(gps_path)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True).dt.tz_convert("Asia/Kolkata")
+    print("Loading cleaned GPS chunks...")
+    df = dataset.to_table(columns=["latitude", "longitude", "timestamp", "speed_kmph"]).to_pandas()
+
+    # Floor timestamp to hour (as an integer bucket). Rows without a
+    # timestamp or with non-finite coordinates have no (hour, grid cell) and
+    # are left out before packing keys, as the groupby dropped missing keys.
+    hours, keep = hour_buckets(df["timestamp"])
+    latitudes = df["latitude"].to_numpy()
+    longitudes = df["longitude"].to_numpy()
+    keep &= np.isfinite(latitudes) & np.isfinite(longitudes)
+    hours = hours[keep]
+    latitudes = latitudes[keep]
+    longitudes = longitudes[keep]
+    speeds = df["speed_kmph"].to_numpy()[keep]
 
-    # Floor timestamp to hour
-    df["hour"] = df["timestamp"].dt.floor("h")
+    # Create coarse grid cell by rounding lat/lon to 2 decimals, kept as integer
+    # hundredths of a degree
+    grid_lat = np.rint(latitudes * 100).astype(np.int64)
+    grid_lon = np.rint(longitudes * 100).astype(np.int64)
 
-    # Create coarse grid cell by rounding lat/lon
-    df["grid_lat"] = df["latitude"].round(2)
-    df["grid_lon"] = df["longitude"].round(2)
-    df["grid_id"] = df["grid_lat"].astype(str) + "_" + df["grid_lon"].astype(str)
+    # Aggregate average speed_kmph per (hour, grid cell). The three keys are
+    # packed into one int64 (coordinates shifted to be non-negative), sorted
+    # once, and every run of equal keys is summed with np.add.reduceat, so no
+    # groupby hash table is built. NaN speeds are left out of sum and count,
+    # as in a pandas mean.
+    keys = (hours * LAT_SPAN + grid_lat + 9_000) * LON_SPAN + grid_lon + 18_000
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    speeds = speeds[order]
+    valid = ~np.isnan(speeds)
+    starts = np.flatnonzero(np.diff(keys, prepend=keys[:1] - 1))
+    sums = np.add.reduceat(np.where(valid, speeds, 0.0), starts)
+    counts = np.add.reduceat(valid.astype(np.int64), starts)
 
-    # Aggregate average speed_kmph per (hour, grid_id)
-    gps_speed = (
-        df.groupby(["hour", "grid_id"])["speed_kmph"]
-            .mean()
-            .reset_index()
-            .rename(columns={"speed_kmph": "avg_speed_kmph"})
-    )
+    # hour and the grid_id label ("26.85_80.95") are only built once per aggregated row
+    keys = keys[starts]
+    buckets = keys // (LAT_SPAN * LON_SPAN)
+    grid_lat = keys // LON_SPAN % LAT_SPAN - 9_000
+    grid_lon = keys % LON_SPAN - 18_000
+    gps_speed = pd.DataFrame({
+        "hour": buckets_to_hours(pd.Series(buckets)),
+        "grid_id": pd.Series(grid_lat / 100).astype(str) + "_" + pd.Series(grid_lon / 100).astype(str),
+        # float32 keeps ~7 significant digits, far finer than the GPS speeds
+        "avg_speed_kmph": (sums / counts).astype(np.float32),
+    })
 
     out_path = PROCESSED_DIR / "gps_speed_features.parquet"
-    gps_speed.to_parquet(out_path, index=False)
+    write_by_day(gps_speed, buckets, out_path)
     print(f"GPS speed features saved to {out_path.name} (rows: {gps_speed.shape[0]})")
 
 
 if __name__ == "__main__":
-    build_od_flows()
+    parser = argparse.ArgumentParser(description="Build OD-flow and GPS speed features.")
+    parser.add_argument("--partitions", type=int, default=1,
+                        help="user buckets for the OD flows, counted in parallel (default: 1, no bucketing)")
+    args = parser.parse_args()
+
+    build_od_flows(num_partitions=args.partitions)
     build_gps_speed_features()
\ No newline at end of file
@@ -1,13 +1,88 @@
-import pandas as pd
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 PROJECT_ROOT   = Path(__file__).resolve().parent.parent.parent
 PROCESSED_DIR  = PROJECT_ROOT / "data" / "processed"
 
+# Parquet settings shared by the merged files and the feature outputs written by
+# feature_engineering.py: zstd pages, dictionary-encoded low-cardinality columns
+# (tower ids, grid ids) and per-row-group statistics so downstream scans can
+# skip row groups.
+PARQUET_OPTIONS = dict(
+    compression="zstd",
+    compression_level=3,
+    use_dictionary=True,
+    data_page_size=1 << 20,
+    write_statistics=True,
+)
+ROW_GROUP_SIZE = 1_000_000
+
+# Merged files carry one timestamp type whatever unit/zone the chunks were
+# written with, so readers get datetime64 in UTC with no parsing or tz_convert
+MERGED_TIMESTAMP = pa.timestamp("us", tz="UTC")
+
+# Files decoded concurrently while merging (and so the most decoded tables
+# held in memory at once, besides the one being written)
+READ_AHEAD = os.cpu_count() or 1
+
+
+def read_tables_ahead(parquet_files, read_ahead=READ_AHEAD):
+    """
+    Yields pq.read_table for each file in order, decoding up to read_ahead
+    files ahead on a thread pool (Arrow decodes without the GIL). A new read
+    is only submitted once the oldest table has been taken, so a slow
+    consumer never has more than read_ahead decoded tables waiting. Each read
+    runs single-threaded, since the pool already supplies the parallelism.
+    """
+    with ThreadPoolExecutor(max_workers=read_ahead) as executor:
+        pending = deque()
+        for path in parquet_files:
+            pending.append(executor.submit(pq.read_table, path, use_threads=False))
+            if len(pending) >= read_ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def concat_parquet_files(parquet_files, out_path):
+    """
+    Streams every file in parquet_files into out_path through a single
+    ParquetWriter, one Arrow table per file, so no combined DataFrame (and
+    no index) is ever built. The output schema is taken from the first file's
+    footer (with timestamp as MERGED_TIMESTAMP), so the writer is opened
+    before any data is read. At most READ_AHEAD files are decoded ahead of
+    the writer (see read_tables_ahead), and tables are written in their
+    original order. Tables whose schema differs from the output schema (e.g.
+    a dictionary-encoded vs plain string tower_id, or Asia/Kolkata
+    timestamps) are cast to it.
+    Returns the number of rows written.
+    """
+    schema = pq.read_schema(parquet_files[0])
+    i = schema.get_field_index("timestamp")
+    if i >= 0:
+        # The pandas metadata is dropped too: it records the chunks' original
+        # time zone, which pandas would re-apply on read
+        schema = schema.set(i, pa.field("timestamp", MERGED_TIMESTAMP)).remove_metadata()
+    num_rows = 0
+    with pq.ParquetWriter(out_path, schema, **PARQUET_OPTIONS) as writer:
+        for table in read_tables_ahead(parquet_files):
+            if not table.schema.equals(schema, check_metadata=False):
+                table = table.cast(schema)
+            writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+            num_rows += table.num_rows
+    return num_rows
+
+
 def merge_cdr_chunks():
     """
     Reads all Parquet files under data/processed/cdr_cleaned/,
-    concatenates them into one DataFrame, and writes to data/processed/cdr_merged.parquet
+    streams them into a single file at data/processed/cdr_merged.parquet.
+    The feature builders scan the cleaned chunks directly, so this is only
+    needed when a single-file copy is wanted (e.g. for ad-hoc analysis).
     """
     cdr_folder = PROCESSED_DIR / "cdr_cleaned"
     if not cdr_folder.exists():
@@ -20,20 +95,17 @@ def merge_cdr_chunks():
         return
 
     print(f"Merging {len(parquet_files)} CDR chunk(s)...")
-    df_list = []
-    for fp in parquet_files:
-        df = pd.read_parquet(fp)
-        df_list.append(df)
-    full_cdr = pd.concat(df_list, ignore_index=True)
     out_path = PROCESSED_DIR / "cdr_merged.parquet"
-    full_cdr.to_parquet(out_path, index=False)
-    print(f"Written merged CDR to {out_path.name} (shape {full_cdr.shape})")
+    num_rows = concat_parquet_files(parquet_files, out_path)
+    print(f"Written merged CDR to {out_path.name} (rows: {num_rows})")
 
 
 def merge_gps_chunks():
     """
     Reads all Parquet files under data/processed/gps_cleaned/,
-    concatenates them, and writes to data/processed/gps_merged.parquet
+    streams them into a single file at data/processed/gps_merged.parquet.
+    The feature builders scan the cleaned chunks directly, so this is only
+    needed when a single-file copy is wanted (e.g. for ad-hoc analysis).
     """
     gps_folder = PROCESSED_DIR / "gps_cleaned"
     if not gps_folder.exists():
@@ -46,14 +118,9 @@ def merge_gps_chunks():
         return
 
     print(f"Merging {len(parquet_files)} GPS chunk(s)...")
-    df_list = []
-    for fp in parquet_files:
-        df = pd.read_parquet(fp)
-        df_list.append(df)
-    full_gps = pd.concat(df_list, ignore_index=True)
     out_path = PROCESSED_DIR / "gps_merged.parquet"
-    full_gps.to_parquet(out_path, index=False)
-    print(f"Written merged GPS to {out_path.name} (shape {full_gps.shape})")
+    num_rows = concat_parquet_files(parquet_files, out_path)
+    print(f"Written merged GPS to {out_path.name} (rows: {num_rows})")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "modeling"))
+
+import feature_engineering  # noqa: E402
+from feature_engineering import buckets_to_hours, count_od_hops  # noqa: E402
+
+
+def od_counts_by_groupby(df):
+    """Reference OD counts: per-user shift, then a groupby on the floored local hour."""
+    df = df.sort_values(["user_id", "timestamp"])
+    df["origin_tower"] = df.groupby("user_id")["tower_id"].shift()
+    df["dest_tower"] = df["tower_id"]
+    df = df.dropna(subset=["origin_tower"])
+    df["hour"] = df["timestamp"].dt.tz_convert("Asia/Kolkata").dt.floor("h")
+    return df.groupby(["hour", "origin_tower", "dest_tower"]).size().reset_index(name="count")
+
+
+def test_count_od_hops_matches_groupby_and_skips_nat():
+    # User 1 has a NaT event and user 4 a null tower; neither may form a hop
+    df = pd.DataFrame({
+        "user_id": [1, 1, 1, 1, 2, 2, 3, 3, 3, 4, 4, 4, 4],
+        "tower_id": ["T1", "T2", "T3", "T1", "T2", "T1", "T3", "T3", "T1", "T1", None, "T2", "T3"],
+        "timestamp": pd.to_datetime([
+            "2024-05-01 00:10", "2024-05-01 00:40", None, "2024-05-01 01:05",
+            "2024-05-01 00:20", "2024-05-01 00:50",
+            "2024-05-01 18:20", "2024-05-01 18:45", "2024-05-01 19:10",
+            "2024-05-01 22:10", "2024-05-01 22:40", "2024-05-01 23:10", "2024-05-01 23:40",
+        ], utc=True),
+    })
+    expected = od_counts_by_groupby(df.copy())
+
+    od, events_per_user = count_od_hops(df.copy())
+    od["hour"] = buckets_to_hours(od["hour"])
+    od[["origin_tower", "dest_tower"]] = od[["origin_tower", "dest_tower"]].astype(str)
+
+    keys = ["hour", "origin_tower", "dest_tower"]
+    pd.testing.assert_frame_equal(
+        od.sort_values(keys, ignore_index=True),
+        expected.sort_values(keys, ignore_index=True),
+        check_dtype=False,
+    )
+    assert events_per_user.to_dict() == {1: 4, 2: 2, 3: 3, 4: 4}
+
+
+def write_cleaned_cdr(folder, num_users=30, num_records=2000):
+    """Writes two cleaned CDR chunks with differing schemas, as the pipeline can produce."""
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame({
+        "user_id": rng.integers(1, num_users + 1, size=num_records),
+        "timestamp": pd.Timestamp("2024-05-01", tz="UTC")
+        + pd.to_timedelta(rng.integers(0, 3 * 24 * 3600, size=num_records), unit="s"),
+        "tower_id": pd.Categorical(rng.choice([f"T{i}" for i in range(1, 11)], size=num_records)),
+    })
+    folder.mkdir(parents=True)
+    half = num_records // 2
+    first = df.iloc[:half].copy()
+    first["timestamp"] = first["timestamp"].dt.tz_convert("Asia/Kolkata").dt.as_unit("ms")
+    first.to_parquet(folder / "a_cleaned.parquet", index=False)
+    second = df.iloc[half:].copy()
+    second["tower_id"] = second["tower_id"].astype(str)
+    second["timestamp"] = second["timestamp"].dt.as_unit("s")
+    second.to_parquet(folder / "b_cleaned.parquet", index=False)
+
+
+def test_bucketed_od_flows_match_single_partition(tmp_path, monkeypatch):
+    write_cleaned_cdr(tmp_path / "cdr_cleaned")
+    monkeypatch.setattr(feature_engineering, "PROCESSED_DIR", tmp_path)
+    monkeypatch.setattr(feature_engineering, "BUCKET_ROW_GROUP_SIZE", 500)
+
+    # Each user lands in exactly one bucket. Each chunk gives each bucket about
+    # 330 rows, so the buffered slices of both chunks make up one row group.
+    dataset = feature_engineering.cleaned_dataset(tmp_path / "cdr_cleaned")
+    (tmp_path / "buckets").mkdir()
+    bucket_paths = feature_engineering.bucket_by_user(dataset, 3, tmp_path / "buckets")
+    users = [set(pq.read_table(path, columns=["user_id"])["user_id"].to_pylist()) for path in bucket_paths]
+    assert sum(len(u) for u in users) == len(set.union(*users)) == 30
+    assert [pq.ParquetFile(path).metadata.num_row_groups for path in bucket_paths] == [1, 1, 1]
+    assert sum(pq.ParquetFile(path).metadata.num_rows for path in bucket_paths) == 2000
+
+    keys = ["hour", "origin_tower", "dest_tower"]
+    results = []
+    for num_partitions in (1, 3):
+        feature_engineering.build_od_flows(num_partitions=num_partitions)
+        od = pd.read_parquet(tmp_path / "od_flows.parquet")
+        od[["origin_tower", "dest_tower"]] = od[["origin_tower", "dest_tower"]].astype(str)
+        results.append(od.sort_values(keys, ignore_index=True))
+    pd.testing.assert_frame_equal(results[0], results[1])
+    assert not list(tmp_path.glob("od_buckets_*"))